@@ -2,13 +2,22 @@ import os
 import fastf1
 import pandas as pd
 import numpy as np
+from scipy import interpolate
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from fastf1.core import Laps
 
 # --- CONFIGURATION ---
 CACHE_DIR = 'data/cache'  # Stores raw FastF1 downloads
 OUTPUT_DIR = 'data/raw'   # Stores processed dataframes
 YEARS = [2022, 2023, 2024]
+MAX_WORKERS = 4  # FastF1 rate-limits per process, so keep concurrent API clients low
+CATEGORICAL_COLS = ['Driver', 'Team', 'Compound', 'EventName', 'CircuitLocation']
+DOWNCAST_DTYPES = {
+    'LapNumber': 'int8', 'Stint': 'int8', 'RoundNumber': 'int8', 'Year': 'int16',
+    'TyreLife': 'float32', 'AirTemp': 'float32', 'TrackTemp': 'float32',
+    'Humidity': 'float32', 'Rainfall': 'float32', 'LapTimeSeconds': 'float32'
+}
 # Set logging to see progress
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -19,17 +28,18 @@ def setup_directories():
     # Enable FastF1 cache
     fastf1.Cache.enable_cache(CACHE_DIR)
 
-def enrich_laps_with_weather(session):
+def enrich_laps_with_weather(laps, weather):
     """
     Merges weather data (AirTemp, TrackTemp, Humidity) into the laps.
     FastF1 weather data is time-series; we map it to the start of each lap.
+    Takes the already-filtered laps so only kept laps are interpolated.
     """
-    laps = session.laps
-    weather = session.weather_data
-    
-    # Convert times to seconds for easier interpolation
-    weather['TimeSec'] = weather['Time'].dt.total_seconds()
-    laps['TimeSec'] = laps['Time'].dt.total_seconds()
+    # Interpolate on the int64 nanosecond view of the timedeltas; no need to
+    # rescale to seconds or store helper columns. Both are cast to ns first so
+    # the view is in the same unit whatever resolution pandas stored. NaT laps stay NaN.
+    weather_t = weather['Time'].to_numpy(dtype='timedelta64[ns]').view('int64').astype(np.float64)
+    laps_t = laps['Time'].to_numpy(dtype='timedelta64[ns]').view('int64').astype(np.float64)
+    laps_t[laps['Time'].isna().to_numpy()] = np.nan
     
     # Interpolate weather data to the exact time the lap finished
     # Note: Using 'Time' (end of lap) gives the conditions at the line. 
@@ -37,12 +47,65 @@ def enrich_laps_with_weather(session):
     
     weather_cols = ['AirTemp', 'TrackTemp', 'Humidity', 'Rainfall']
     
-    for col in weather_cols:
-        # Interpolate weather data to match lap times
-        laps[col] = np.interp(laps['TimeSec'], weather['TimeSec'], weather[col])
+    # Interpolate all weather channels in one call so the lap-time search is shared.
+    # Out-of-range laps hold the first/last reading, matching np.interp behaviour.
+    # Channels are packed once into a contiguous (n_weather, 4) float32 buffer.
+    wvals = weather[weather_cols].to_numpy(dtype=np.float32)
+    interp = interpolate.interp1d(
+        weather_t, wvals, kind='linear', axis=0,
+        bounds_error=False, fill_value=(wvals[0], wvals[-1])
+    )
+    laps[weather_cols] = interp(laps_t)
         
     return laps
 
+def _init_worker():
+    """Enable the shared FastF1 file cache inside each worker process."""
+    fastf1.Cache.enable_cache(CACHE_DIR)
+
+def _process_one_race(year, round_number, event_name, location):
+    """
+    Downloads and processes a single race. Returns None if it has no clean laps;
+    load errors propagate so the caller can account for the failed round.
+    """
+    logging.info(f"  -> Processing Round {round_number}: {event_name}")
+    
+    # Load the Race Session
+    session = fastf1.get_session(year, round_number, 'R')
+    session.load(telemetry=False, weather=True, messages=False) # Telemetry=False to save memory for now
+    
+    # 1. Filter: Valid Laps Only
+    # pick_accurate() removes laps with safety cars, VSC, or erroneous timing
+    # pick_wo_box() removes in-laps and out-laps
+    clean_laps = session.laps.pick_accurate().pick_wo_box().reset_index(drop=True)
+    
+    if clean_laps.empty:
+        logging.warning(f"     No clean laps found for {event_name}. Skipping.")
+        return None
+
+    # 2. Enrich: Add Weather Data
+    clean_laps = enrich_laps_with_weather(clean_laps, session.weather_data)
+    
+    # 3. Enrich: Add Context Metadata
+    clean_laps['RoundNumber'] = round_number
+    clean_laps['EventName'] = event_name
+    clean_laps['Year'] = year
+    clean_laps['CircuitLocation'] = location
+    
+    # 4. Filter: Keep only necessary columns to keep file size down
+    # Will engineer complex features (fuel, traffic) in the next step
+    keep_cols = [
+        'Driver', 'LapTime', 'LapNumber', 'Stint', 'PitOutTime', 
+        'PitInTime', 'Compound', 'TyreLife', 'FreshTyre',
+        'Team', 'Year', 'RoundNumber', 'EventName', 'CircuitLocation',
+        'AirTemp', 'TrackTemp', 'Humidity', 'Rainfall', 'TrackStatus'
+    ]
+    
+    # Ensure only keep columns that actually exist
+    available_cols = [c for c in keep_cols if c in clean_laps.columns]
+    # Return a plain DataFrame so the result pickles cleanly back to the parent
+    return pd.DataFrame(clean_laps[available_cols])
+
 def process_season(year):
     """Downloads and processes all races for a given year."""
     logging.info(f"Starting ingestion for Season {year}")
@@ -53,53 +116,40 @@ def process_season(year):
     # Filter for official races only (exclude testing)
     races = schedule[schedule['EventFormat'] != 'testing']
     
-    all_season_laps = []
+    round_numbers = races['RoundNumber'].to_numpy()
+    event_names = races['EventName'].to_numpy()
+    locations = races['Location'].to_numpy()
     
-    for _, race in races.iterrows():
-        round_number = race['RoundNumber']
-        event_name = race['EventName']
-        
-        logging.info(f"  -> Processing Round {round_number}: {event_name}")
-        
-        try:
-            # Load the Race Session
-            session = fastf1.get_session(year, round_number, 'R')
-            session.load(telemetry=False, weather=True, messages=False) # Telemetry=False to save memory for now
-            
-            # 1. Filter: Valid Laps Only
-            # pick_accurate() removes laps with safety cars, VSC, or erroneous timing
-            # pick_wo_box() removes in-laps and out-laps
-            clean_laps = session.laps.pick_accurate().pick_wo_box().reset_index(drop=True)
-            
-            if clean_laps.empty:
-                logging.warning(f"     No clean laps found for {event_name}. Skipping.")
-                continue
+    # Each race load is independent (network + parsing), so fan them out across processes.
+    # Workers share the file-backed FastF1 cache in CACHE_DIR.
+    races_args = list(zip(round_numbers, event_names, locations))
+    race_laps = [None] * len(races_args)
+    failed = []
+    max_workers = max(1, min(len(races_args), MAX_WORKERS))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(_process_one_race, year, *args) for args in races_args]
+        for i, future in enumerate(futures):
+            try:
+                race_laps[i] = future.result()
+            except Exception as e:
+                logging.warning(f"     Failed to process {races_args[i][1]}: {e}. Will retry.")
+                failed.append(i)
 
-            # 2. Enrich: Add Weather Data
-            clean_laps = enrich_laps_with_weather(session)
-            
-            # 3. Enrich: Add Context Metadata
-            clean_laps['RoundNumber'] = round_number
-            clean_laps['EventName'] = event_name
-            clean_laps['Year'] = year
-            clean_laps['CircuitLocation'] = race['Location']
-            
-            # 4. Filter: Keep only necessary columns to keep file size down
-            # Will engineer complex features (fuel, traffic) in the next step
-            keep_cols = [
-                'Driver', 'LapTime', 'LapNumber', 'Stint', 'PitOutTime', 
-                'PitInTime', 'Compound', 'TyreLife', 'FreshTyre',
-                'Team', 'Year', 'RoundNumber', 'EventName', 'CircuitLocation',
-                'AirTemp', 'TrackTemp', 'Humidity', 'Rainfall', 'TrackStatus'
-            ]
-            
-            # Ensure only keep columns that actually exist
-            available_cols = [c for c in keep_cols if c in clean_laps.columns]
-            all_season_laps.append(clean_laps[available_cols])
-            
+    # Parallel loads are more prone to transient (e.g. rate-limit) errors,
+    # so give failed rounds one more serial attempt before skipping them
+    missing_rounds = []
+    for i in failed:
+        round_number, event_name, location = races_args[i]
+        try:
+            race_laps[i] = _process_one_race(year, round_number, event_name, location)
         except Exception as e:
             logging.error(f"     Failed to process {event_name}: {e}")
-            continue
+            missing_rounds.append(int(round_number))
+
+    if missing_rounds:
+        logging.error(f"Season {year} is missing rounds {missing_rounds}")
+
+    all_season_laps = [laps for laps in race_laps if laps is not None]
 
     if not all_season_laps:
         return None
@@ -109,6 +159,22 @@ def process_season(year):
     
     # Convert LapTime to seconds (Float) immediately for easier math later
     season_df['LapTimeSeconds'] = season_df['LapTime'].dt.total_seconds()
+    # The timedelta column is never used downstream once converted
+    season_df = season_df.drop(columns=['LapTime'])
+    
+    # Highly repetitive string columns -> categoricals (dictionary-encoded in parquet)
+    for col in CATEGORICAL_COLS:
+        if col in season_df.columns:
+            season_df[col] = season_df[col].astype('category')
+    
+    # Downcast numerics to the smallest dtype that holds their range.
+    # Integer columns with gaps stay float32 since NaN has no integer representation.
+    for col, dtype in DOWNCAST_DTYPES.items():
+        if col not in season_df.columns:
+            continue
+        if np.dtype(dtype).kind == 'i' and season_df[col].isna().any():
+            dtype = 'float32'
+        season_df[col] = season_df[col].astype(dtype)
     
     return season_df
 
@@ -1,15 +1,63 @@
 import pandas as pd
 import numpy as np
+import pyarrow.dataset as ds
 import logging
 import os
+from numba import njit, prange
 
 # --- CONFIGURATION ---
 RAW_DATA_PATH = 'data/raw'
 PROCESSED_DATA_PATH = 'data/processed'
-OUTPUT_FILE = 'f1_training_data.parquet'
+OUTPUT_DATASET = 'f1_training_data'  # Directory of Year=... parquet partitions
+
+# Raw columns used downstream; everything else is skipped at read time
+NEEDED = [
+    'Driver', 'LapNumber', 'Stint', 'Compound', 'TyreLife',
+    'Team', 'Year', 'RoundNumber', 'EventName', 'CircuitLocation',
+    'AirTemp', 'TrackTemp', 'Humidity', 'Rainfall', 'TrackStatus', 'LapTimeSeconds'
+]
+
+# Compound Softness Scale (1=Hard, 2=Medium, 3=Soft, 0=Wet/Inter)
+COMPOUND_SOFTNESS = {'HARD': 1, 'MEDIUM': 2, 'SOFT': 3, 'INTERMEDIATE': 0, 'WET': 0}
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 
+@njit(parallel=True, cache=True)
+def _build_features(race_id, lap_number, lap_time_s, compound_code, tyre_life,
+                    total_laps, median_pace, softness_lut):
+    """
+    Single pass over the raw lap arrays computing FuelMass, Compound_Softness,
+    TyreAge and the keep mask (dry compound and not a slow outlier).
+    Rows with a missing race key get a 55 lap race and are never outliers.
+    """
+    n = race_id.shape[0]
+    fuel = np.empty(n, dtype=np.float64)
+    softness = np.empty(n, dtype=softness_lut.dtype)
+    tyre_age = np.empty(n, dtype=np.int64)
+    keep = np.empty(n, dtype=np.bool_)
+
+    for i in prange(n):
+        r = race_id[i]
+        race_laps = total_laps[r] if r >= 0 else 55.0
+        median = median_pace[r] if r >= 0 else np.nan
+
+        # Fuel = LapsRemaining * BurnRate + SafetyMargin(5kg)
+        # Clip negative fuel (in case of extra laps/errors) to min 2kg
+        f = (race_laps - lap_number[i]) * 1.7 + 5.0
+        fuel[i] = 2.0 if f < 2.0 else f
+
+        soft = softness_lut[compound_code[i]]
+        softness[i] = soft
+
+        t = tyre_life[i]
+        tyre_age[i] = 1 if np.isnan(t) else int(t)
+
+        # Drop Wet/Inter laps, and laps 20% slower than median (e.g. spin, damage).
+        # Trying to model "Tire Wear", not "Crashes".
+        keep[i] = soft > 0 and not (lap_time_s[i] > median * 1.20)
+
+    return fuel, softness, tyre_age, keep
+
 class FeatureEngineer:
     def __init__(self):
         self.df = None
@@ -20,88 +68,77 @@ class FeatureEngineer:
         if not files:
             raise FileNotFoundError(f"No data found in {RAW_DATA_PATH}. Run ingest_data.py first.")
         
-        dfs = []
-        for file in files:
-            path = os.path.join(RAW_DATA_PATH, file)
-            dfs.append(pd.read_parquet(path))
-            logging.info(f"Loaded {file}")
-            
-        self.df = pd.concat(dfs, ignore_index=True)
+        # Scan every yearly file as one logical table and convert to pandas once,
+        # releasing Arrow buffers as columns are handed over
+        paths = [os.path.join(RAW_DATA_PATH, file) for file in files]
+        dataset = ds.dataset(paths, format='parquet')
+        self.df = dataset.to_table(columns=NEEDED).to_pandas(self_destruct=True, split_blocks=True)
+        logging.info(f"Loaded {', '.join(files)}")
         logging.info(f"Total raw samples: {len(self.df)}")
 
-    def calculate_fuel_mass(self):
+    def build_features(self):
         """
-        Estimates fuel mass.
-        Rule of thumb: F1 cars start with ~110kg and burn ~1.7kg per lap.
+        Engineers FuelMass, Compound_Softness, TyreAge and TrackTemp and drops
+        Wet/Inter laps and slow outliers, in one compiled pass over NumPy arrays.
+        Fuel rule of thumb: F1 cars start with ~110kg and burn ~1.7kg per lap.
         """
-        # Calculate max laps for each race to estimate fuel load at start
-        # (This handles different race lengths like Spa vs Monaco)
-        race_lengths = self.df.groupby(['Year', 'EventName'])['LapNumber'].max().to_dict()
-        
-        def get_fuel(row):
-            total_laps = race_lengths.get((row['Year'], row['EventName']), 55) # Default to 55 if missing
-            laps_remaining = total_laps - row['LapNumber']
-            # Fuel = LapsRemaining * BurnRate + SafetyMargin(5kg)
-            return (laps_remaining * 1.7) + 5
+        # ngroup() leaves rows with a missing Year/EventName as NaN; map those to -1
+        race_id = self.df.groupby(['Year', 'EventName'], sort=False, observed=True).ngroup() \
+                         .fillna(-1).to_numpy(dtype=np.int64)
+        n_races = int(race_id.max()) + 1 if len(race_id) else 0
+        compound_code, compounds = pd.factorize(self.df['Compound'])
+        # Trailing 0 catches missing compounds, which factorize codes as -1
+        softness_lut = np.array([COMPOUND_SOFTNESS.get(c, 0) for c in compounds] + [0], dtype=np.int8)
 
-        self.df['FuelMass'] = self.df.apply(get_fuel, axis=1)
-        # Clip negative fuel (in case of extra laps/errors) to min 2kg
-        self.df['FuelMass'] = self.df['FuelMass'].clip(lower=2.0)
-        logging.info("Feature Engineered: FuelMass")
+        lap_number = self.df['LapNumber'].to_numpy(dtype=np.float64)
+        lap_time_s = self.df['LapTimeSeconds'].to_numpy(dtype=np.float64)
 
-    def encode_physics_features(self):
-        """
-        Transforms categorical compounds and cleans numeric features.
-        """
-        # 1. Compound Softness Scale (1=Hard, 2=Medium, 3=Soft)
-        # This helps the model learn that Soft > Medium > Hard in terms of grip
-        compound_map = {'HARD': 1, 'MEDIUM': 2, 'SOFT': 3, 'INTERMEDIATE': 0, 'WET': 0}
-        self.df['Compound_Softness'] = self.df['Compound'].map(compound_map)
-        
-        # Filter out Wet/Inter races for the "Dry" Physics Model
-        initial_count = len(self.df)
-        self.df = self.df[self.df['Compound_Softness'] > 0]
-        logging.info(f"Filtered Wet/Inter laps. Dropped {initial_count - len(self.df)} laps.")
+        # Max laps per race estimates the fuel load at start (handles Spa vs Monaco).
+        # Median pace uses only the dry laps that survive the compound filter.
+        total_laps = pd.Series(lap_number).groupby(race_id).max() \
+                       .reindex(range(n_races)).to_numpy(dtype=np.float64)
+        is_dry = softness_lut[compound_code] > 0
+        median_pace = pd.Series(lap_time_s[is_dry]).groupby(race_id[is_dry]).median() \
+                        .reindex(range(n_races)).to_numpy(dtype=np.float64)
 
-        # 2. Tyre Life (Cast to integer)
-        self.df['TyreAge'] = self.df['TyreLife'].fillna(1).astype(int)
+        fuel, softness, tyre_age, keep = _build_features(
+            race_id, lap_number, lap_time_s, compound_code,
+            self.df['TyreLife'].to_numpy(dtype=np.float64),
+            total_laps, median_pace, softness_lut
+        )
 
-        # 3. Track Temp (Fill missing with median of that race)
-        self.df['TrackTemp'] = self.df.groupby(['Year', 'EventName'])['TrackTemp'] \
-                                      .transform(lambda x: x.fillna(x.median()))
-        
-        logging.info("Feature Engineered: Compound_Softness, TyreAge, TrackTemp")
+        # Track Temp medians over the dry laps only, so the groupby scans the reduced set.
+        # Trailing NaN slot leaves rows with a missing race key (-1) unfilled.
+        track_temp = self.df['TrackTemp'].to_numpy()
+        race_temp = pd.Series(track_temp[is_dry]).groupby(race_id[is_dry]).median() \
+                      .reindex(range(n_races + 1)).to_numpy(dtype=track_temp.dtype)
+        kept_temp = track_temp[keep]
+        kept_temp = np.where(np.isnan(kept_temp), race_temp[race_id[keep]], kept_temp)
 
-    def create_target_variable(self):
-        """
-        Cleans the target variable (LapTime).
-        Remove extreme outliers (e.g., > 105% of median pace) that aren't picked up by FastF1 filters.
-        """
-        # Calculate Median Lap Time per Race
-        race_medians = self.df.groupby(['Year', 'EventName'])['LapTimeSeconds'].median()
-        
-        def is_outlier(row):
-            median_pace = race_medians.loc[(row['Year'], row['EventName'])]
-            # If lap is 20% slower than median (e.g. spin, damage), drop it.
-            # Trying to model "Tire Wear", not "Crashes".
-            return row['LapTimeSeconds'] > (median_pace * 1.20)
-
-        # Apply filter
-        outliers = self.df.apply(is_outlier, axis=1)
-        self.df = self.df[~outliers]
-        
-        logging.info(f"Removed {outliers.sum()} slow outliers (spins/damage).")
+        initial_count = len(self.df)
+        self.df = self.df[keep].assign(
+            FuelMass=fuel[keep], Compound_Softness=softness[keep], TyreAge=tyre_age[keep],
+            TrackTemp=kept_temp
+        )
+        logging.info(f"Filtered Wet/Inter laps and slow outliers. Dropped {initial_count - len(self.df)} laps.")
+
+        logging.info("Feature Engineered: FuelMass, Compound_Softness, TyreAge, TrackTemp")
 
     def save_processed_data(self):
         os.makedirs(PROCESSED_DATA_PATH, exist_ok=True)
-        path = os.path.join(PROCESSED_DATA_PATH, OUTPUT_FILE)
-        self.df.to_parquet(path, index=False)
+        path = os.path.join(PROCESSED_DATA_PATH, OUTPUT_DATASET)
+        # Partition by Year so readers can push filters down, e.g.
+        # pd.read_parquet(path, filters=[('Year', '==', 2024)]) only touches that season.
+        # Existing partitions are replaced rather than appended to on re-runs.
+        self.df.to_parquet(
+            path, index=False, partition_cols=['Year'], engine='pyarrow',
+            compression='zstd', row_group_size=200_000,
+            existing_data_behavior='delete_matching'
+        )
         logging.info(f"Saved processed data to {path} ({len(self.df)} rows)")
 
 if __name__ == "__main__":
     fe = FeatureEngineer()
     fe.load_raw_data()
-    fe.calculate_fuel_mass()
-    fe.encode_physics_features()
-    fe.create_target_variable()
+    fe.build_features()
     fe.save_processed_data()
\ No newline at end of file
@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'features'))
+import build_features  # noqa: E402
+
+
+class BuildFeaturesTest(unittest.TestCase):
+    def test_missing_race_key_uses_default_race_length(self):
+        fe = build_features.FeatureEngineer()
+        fe.df = pd.DataFrame({
+            'Year': [2024, 2024, 2024, 2024],
+            'EventName': ['Monaco', 'Monaco', 'Monaco', np.nan],
+            'LapNumber': np.array([1, 2, 3, 4], dtype='int8'),
+            'LapTimeSeconds': np.array([90.0, 91.0, 200.0, 90.0], dtype='float32'),
+            'Compound': pd.Categorical(['SOFT', 'HARD', 'SOFT', 'MEDIUM']),
+            'TyreLife': [1.0, np.nan, 3.0, 4.0],
+            'TrackTemp': np.array([30.0, np.nan, 31.0, np.nan], dtype='float32'),
+        })
+
+        fe.build_features()
+
+        # Lap 3 is a slow outlier; the NaN-key lap is kept and never treated as one
+        self.assertEqual(fe.df['LapNumber'].tolist(), [1, 2, 4])
+        np.testing.assert_allclose(fe.df['FuelMass'], [(3 - 1) * 1.7 + 5, (3 - 2) * 1.7 + 5, (55 - 4) * 1.7 + 5])
+        self.assertEqual(fe.df['Compound_Softness'].tolist(), [3, 1, 2])
+        self.assertEqual(fe.df['TyreAge'].tolist(), [1, 1, 4])
+        # Missing TrackTemp takes the race's dry-lap median; no race key means nothing to fill from
+        np.testing.assert_allclose(fe.df['TrackTemp'].to_numpy(), [30.0, 30.5, np.nan])
+
+
+if __name__ == '__main__':
+    unittest.main()